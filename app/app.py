@@ -1,10 +1,16 @@
 import os
-import json
+import functools
+import hashlib
+import random
 import time
-from urllib.parse import urljoin
-import requests
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import TYPE_CHECKING
+import orjson
 import streamlit as st
 
+if TYPE_CHECKING:
+    import httpx
+
 # ==============================
 # Config
 # ==============================
@@ -13,38 +19,128 @@ API_URL = os.getenv(
     "https://backend-desafio5-agente-autonomos.onrender.com"
 ).rstrip("/")
 
+# caminhos locais (plot_path) só existem quando o backend roda na mesma máquina
+_LOCAL_FS = os.getenv("STREAMLIT_LOCAL_FS", "0") == "1"
+# prefixos de plot_paths servidos por HTTP (o resto é caminho no disco do backend)
+_REMOTE_PREFIXES = ("http://", "https://", "/static/")
+
 st.set_page_config(page_title="Agente EDA Autônomo", page_icon="🧠", layout="wide")
 
 # ==============================
 # Helpers
 # ==============================
-def _abs_url(base: str, maybe_path: str | None) -> str | None:
+@functools.lru_cache(maxsize=512)
+def _abs_url(maybe_path: str | None) -> str | None:
     if not maybe_path:
         return None
     if maybe_path.startswith(("http://", "https://")):
         return maybe_path
-    return urljoin(base + "/", maybe_path.lstrip("/"))
+    from urllib.parse import urljoin
+    return urljoin(API_URL + "/", maybe_path.lstrip("/"))
+
+_CONNECT_TIMEOUT = 10.0
+
+def _timeout(seconds: float) -> "httpx.Timeout":
+    """
+    Timeout por chamada que preserva o limite de conexão: um float puro
+    substituiria também o connect (900s só para conectar no /profile).
+    """
+    import httpx
+
+    return httpx.Timeout(seconds, connect=min(seconds, _CONNECT_TIMEOUT))
+
+@st.cache_resource
+def _client() -> "httpx.Client":
+    """
+    Cliente HTTP/2 compartilhado entre reruns: as chamadas em paralelo
+    (sondagem de candidatos, gráficos) são multiplexadas numa única conexão
+    TCP+TLS com o backend.
+    O import fica aqui para não pesar no cold start do Streamlit.
+    """
+    import httpx
+
+    transport = httpx.HTTPTransport(
+        http2=True,
+        retries=3,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+    )
+    return httpx.Client(
+        transport=transport,
+        headers={"Accept-Encoding": "gzip", "User-Agent": "streamlit-eda/1.0"},
+        timeout=_timeout(300.0),
+        follow_redirects=True,
+    )
+
+_RETRY_STATUS = (502, 503, 504)
 
-def _get(path: str, timeout=120, params: dict | None = None):
-    return requests.get(f"{API_URL}{path}", params=params, timeout=timeout)
+def _get(path: str, timeout=120, params: dict | None = None, retries: int = 2, backoff: float = 0.3):
+    # o transport só repete erros de conexão; 502/503/504 (backend do Render
+    # ainda subindo) são repetidos aqui, apenas para GET, que é idempotente
+    for attempt in range(retries + 1):
+        r = _client().get(f"{API_URL}{path}", params=params, timeout=_timeout(timeout))
+        if r.status_code not in _RETRY_STATUS or attempt == retries:
+            return r
+        time.sleep(backoff * (2 ** attempt))
 
 def _post_json(path: str, payload: dict, timeout=300):
-    return requests.post(f"{API_URL}{path}", json=payload, timeout=timeout)
+    return _client().post(f"{API_URL}{path}", json=payload, timeout=_timeout(timeout))
 
 def _upload_csv(file):
+    # o httpx envia o multipart em blocos, sem montar o corpo inteiro em memória
     files = {"file": (file.name, file, "text/csv")}
-    return requests.post(f"{API_URL}/upload/", files=files, timeout=1200)
+    return _client().post(f"{API_URL}/upload/", files=files, timeout=_timeout(1200))
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def _fetch_image_bytes(url: str) -> bytes:
+    # memoiza o PNG por URL: reruns não baixam o gráfico de novo.
+    # Timeout curto: a busca bloqueia o script e falhas não ficam em cache
+    r = _client().get(url, timeout=_timeout(10))
+    r.raise_for_status()
+    return r.content
+
+def _fetch_images(urls: list[str]) -> list[bytes | None]:
+    """Baixa vários gráficos em paralelo; None para os que falharem."""
+    def fetch(url):
+        try:
+            return _fetch_image_bytes(url)
+        except Exception:
+            return None
+    if not urls:
+        return []
+    with ThreadPoolExecutor(max_workers=min(8, len(urls))) as ex:
+        return list(ex.map(fetch, urls))
+
+def _file_digest(file, chunk_size: int = 1 << 20) -> str:
+    # hash em blocos de 1 MiB para não copiar o arquivo inteiro em memória
+    h = hashlib.blake2b(digest_size=16)
+    file.seek(0)
+    while chunk := file.read(chunk_size):
+        h.update(chunk)
+    file.seek(0)
+    return h.hexdigest()
+
+def _dumps(obj) -> str:
+    """
+    Serializa para o st.json com orjson (em C) em vez do json.dumps que o
+    Streamlit usaria; cai no json da stdlib se o orjson recusar o objeto.
+    """
+    try:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    except (orjson.JSONEncodeError, TypeError):
+        import json
+        return json.dumps(obj, ensure_ascii=False, default=repr)
+
+_UNITS = ("B", "KB", "MB", "GB", "TB", "PB")
 
 def _human_bytes(num):
-    for unit in ["B", "KB", "MB", "GB", "TB"]:
-        if num < 1024:
-            return f"{num:.1f} {unit}"
-        num /= 1024.0
+    # bit_length dá direto o expoente de 1024, sem laço de divisões
+    i = min((max(int(num), 1).bit_length() - 1) // 10, len(_UNITS) - 1)
+    return f"{num / (1 << (10 * i)):.1f} {_UNITS[i]}"
 
-def _health():
+def _health_uncached(timeout: float = 5) -> tuple[bool, str]:
     try:
-        r = _get("/health", timeout=5)
-        if r.ok:
+        r = _get("/health", timeout=timeout)
+        if r.is_success:
             try:
                 j = r.json() or {}
             except Exception:
@@ -55,6 +151,11 @@ def _health():
     except Exception as e:
         return False, str(e)
 
+@st.cache_data(ttl=10, show_spinner=False)
+def _health() -> tuple[bool, str]:
+    # evita um GET /health a cada rerun; _wake_server usa a versão sem cache
+    return _health_uncached()
+
 def _health_badge():
     ok, msg = _health()
     if ok:
@@ -63,17 +164,26 @@ def _health_badge():
         st.error(f"Backend offline ❌ ({msg})")
     return ok
 
-def _wake_server(max_wait_sec: int = 120, interval_sec: float = 2.5):
-    start = time.time()
+def _wake_server(max_wait_sec: int = 120, max_interval_sec: float = 4.0, probe_timeout: float = 3.0):
+    # backoff exponencial com jitter: sondagens frequentes logo no início,
+    # mais espaçadas enquanto o Render ainda está subindo
+    deadline = time.time() + max_wait_sec
+    delay = 0.5
     last = ""
-    while time.time() - start < max_wait_sec:
-        ok, msg = _health()
+    while (remaining := deadline - time.time()) > 0:
+        # timeout curto por sondagem: detecta o backend assim que ele responde
+        ok, msg = _health_uncached(timeout=min(probe_timeout, remaining))
         if ok:
             return True, "Servidor acordado e pronto! ✅"
         last = msg
-        time.sleep(interval_sec)
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        time.sleep(min(min(delay, max_interval_sec) + random.uniform(0, 0.25), remaining))
+        delay *= 1.7
     return False, f"Não foi possível acordar em {max_wait_sec}s. Último status: {last}"
 
+@st.cache_data(show_spinner=False)
 def _candidates_from_upload(data: dict, uploaded_name: str) -> list[str]:
     """
     Gera possíveis identificadores de dataset aceitos pelo backend:
@@ -118,71 +228,155 @@ def _candidates_from_upload(data: dict, uploaded_name: str) -> list[str]:
             seen.add(c)
     return uniq
 
-def _try_profile(candidates: list[str], show_json=False) -> tuple[bool, str | None, dict | None, str | None]:
+def _first_ok(candidates: list[str], call, max_workers: int | None = None, known: bool = False) -> tuple[bool, str | None, dict | None, str | None]:
     """
-    Tenta gerar o perfil usando cada candidato em ordem.
+    Dispara `call(name)` para todos os candidatos em paralelo e fica com a
+    primeira resposta 2xx; as demais são ignoradas.
+    Com `known=True` o primeiro candidato já funcionou antes: é testado
+    sozinho e os demais só entram se ele falhar.
     Retorna: (ok, name_que_funcionou, json_resposta, erro_texto)
     """
+    if not candidates:
+        return False, None, None, None
+    if known:
+        ok, name, j, err = _first_ok(candidates[:1], call)
+        if ok or len(candidates) == 1:
+            return ok, name, j, err
+        candidates = candidates[1:]
+    ex = ThreadPoolExecutor(max_workers=max_workers or len(candidates))
+    futures = {ex.submit(call, name): name for name in candidates}
+    pending = set(futures)
     last_err = None
-    for name in candidates:
-        try:
-            resp = _get(f"/profile/{name}", timeout=900)
-            if resp.ok:
-                j = resp.json()
-                return True, name, j, None
-            else:
-                last_err = f"{resp.status_code} • {resp.text[:200]}"
-        except Exception as e:
-            last_err = str(e)
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                try:
+                    resp = fut.result()
+                    if resp.is_success:
+                        # orjson decodifica os perfis grandes bem mais rápido que resp.json()
+                        return True, futures[fut], orjson.loads(resp.content), None
+                    else:
+                        last_err = f"{resp.status_code} • {resp.text[:200]}"
+                except Exception as e:
+                    last_err = str(e)
+    finally:
+        ex.shutdown(wait=False, cancel_futures=True)
     return False, None, None, last_err
 
-def _try_profile_show(candidates: list[str]) -> tuple[bool, str | None, dict | None, str | None]:
-    last_err = None
-    for name in candidates:
-        try:
-            resp = _get(f"/profile/show/{name}", timeout=120)
-            if resp.ok:
-                j = resp.json()
-                return True, name, j, None
-            else:
-                last_err = f"{resp.status_code} • {resp.text[:200]}"
-        except Exception as e:
-            last_err = str(e)
-    return False, None, None, last_err
+def _try_profile(candidates: list[str], show_json=False, known: bool = False) -> tuple[bool, str | None, dict | None, str | None]:
+    """
+    Tenta gerar o perfil testando os candidatos em paralelo.
+    Retorna: (ok, name_que_funcionou, json_resposta, erro_texto)
+    """
+    # geração de perfil é pesada: no máximo 3 em paralelo para não sobrecarregar o Render
+    return _first_ok(candidates, lambda name: _get(f"/profile/{name}", timeout=900), max_workers=3, known=known)
+
+def _try_profile_show(candidates: list[str], known: bool = False) -> tuple[bool, str | None, dict | None, str | None]:
+    return _first_ok(candidates, lambda name: _get(f"/profile/show/{name}", timeout=120), known=known)
+
+def _try_agent_ask(candidates: list[str], question: str, known: bool = False) -> tuple[bool, str | None, dict | None, str | None]:
+    def call(name):
+        payload = {"dataset": name, "question": question}
+        return _post_json("/agent/ask", payload, timeout=300)
+    return _first_ok(candidates, call, known=known)
+
+def _plot_urls(details) -> list[str]:
+    """URLs absolutas dos gráficos citados em `details` (plot_url + plot_paths remotos)."""
+    if not isinstance(details, dict):
+        return []
+    urls = [_abs_url(details.get("plot_url"))]
+    many = details.get("plot_paths")
+    if isinstance(many, list):
+        urls += [_abs_url(p) for p in many if isinstance(p, str) and p.startswith(_REMOTE_PREFIXES)]
+    return [u for u in urls if u]
+
+def _ask_and_prefetch(candidates: list[str], question: str, known: bool = False):
+    """
+    Consulta o agente e, ainda na thread de segundo plano, já baixa os
+    gráficos da resposta: quando o script renderiza, as imagens estão no cache.
+    """
+    result = _try_agent_ask(candidates, question, known)
+    ok, _, ans, _ = result
+    if ok and isinstance(ans, dict):
+        _fetch_images(_plot_urls(ans.get("details")))
+    return result
+
+def _remember_dataset(used: str):
+    """Fixa o nome que funcionou e o coloca na frente dos candidatos."""
+    st.session_state.dataset_name = used
+    st.session_state.dataset_candidates = [used] + [c for c in st.session_state.dataset_candidates if c != used]
+    st.session_state.dataset_verified = True
+
+def _reset_candidates():
+    """Volta a testar todos os candidatos do último upload, na ordem original."""
+    last = st.session_state.last_upload
+    if last:
+        st.session_state.dataset_candidates = list(last["candidates"])
+    st.session_state.dataset_verified = False
+
+@st.cache_resource
+def _bg_pool() -> ThreadPoolExecutor:
+    # executa chamadas longas (perfil / agente) fora da thread do script
+    return ThreadPoolExecutor(max_workers=4)
+
+def _start_job(key: str, fn, *args, **extra):
+    st.session_state[key] = {"future": _bg_pool().submit(fn, *args), "started": time.time(), **extra}
+    st.rerun()
+
+def _poll_job(key: str):
+    """
+    Se o job em `key` terminou, remove-o do session_state e devolve (job, resultado);
+    caso contrário devolve None (o progresso fica a cargo de `_job_watcher`).
+    """
+    job = st.session_state.get(key)
+    if not job or not job["future"].done():
+        return None
+    st.session_state[key] = None
+    return job, job["future"].result()
 
-def _try_agent_ask(candidates: list[str], question: str) -> tuple[bool, str | None, dict | None, str | None]:
-    last_err = None
-    for name in candidates:
-        try:
-            payload = {"dataset": name, "question": question}
-            resp = _post_json("/agent/ask", payload, timeout=300)
-            if resp.ok:
-                j = resp.json()
-                return True, name, j, None
-            else:
-                last_err = f"{resp.status_code} • {resp.text[:200]}"
-        except Exception as e:
-            last_err = str(e)
-    return False, None, None, last_err
+@st.fragment(run_every=1)
+def _job_watcher(key: str, label: str, timeout: float):
+    """
+    Acompanha o job em `key` sem reexecutar o app: só este fragmento roda a
+    cada segundo; quando o job termina, um rerun do app entrega o resultado.
+    """
+    job = st.session_state.get(key)
+    if not job:
+        return
+    if job["future"].done():
+        st.rerun()
+    elapsed = time.time() - job["started"]
+    st.progress(min(elapsed / timeout, 1.0), text=f"{label} ({elapsed:.0f}s)")
+
+@st.cache_data
+def _header_html(api_url: str) -> str:
+    return f"""
+<div style="display:flex;align-items:center;gap:12px;flex-wrap:wrap;">
+  <h2 style="margin:0;">🧠 Agente Autônomo de EDA</h2>
+  <code style="background:#f6f6f6;padding:2px 6px;border-radius:6px;">API: {api_url}</code>
+</div>
+"""
+
+@st.cache_data
+def _tips_md() -> str:
+    return (
+        "- **Passo 1**: Envie o CSV.\n"
+        "- **Passo 2**: Gere o **perfil global**.\n"
+        "- **Passo 3**: Faça perguntas (peça gráficos: histograma, heatmap, boxplot, série temporal, scatter…)."
+    )
 
 # ==============================
 # Header
 # ==============================
-st.markdown(
-    f"""
-<div style="display:flex;align-items:center;gap:12px;flex-wrap:wrap;">
-  <h2 style="margin:0;">🧠 Agente Autônomo de EDA</h2>
-  <code style="background:#f6f6f6;padding:2px 6px;border-radius:6px;">API: {API_URL}</code>
-</div>
-""",
-    unsafe_allow_html=True
-)
+st.markdown(_header_html(API_URL), unsafe_allow_html=True)
 
 left, right = st.columns([1, 6])
 with left:
     if st.button("🚀 Acordar servidor"):
         with st.spinner("Acordando o backend no Render…"):
             ok, msg = _wake_server()
+        _health.clear()
         st.success(msg) if ok else st.warning(msg)
 with right:
     st.caption("Se o backend estiver em sleep, clique em **Acordar servidor** antes de usar.")
@@ -193,174 +387,258 @@ with right:
 with st.sidebar:
     st.markdown("## ⚙️ Config")
     st.write("API URL:", f"`{API_URL}`")
-    backend_ok = _health_badge()
+    if st.button("🔄 Revalidar"):
+        _health.clear()
+    _health_badge()
     st.markdown("---")
     st.markdown("### ℹ️ Dicas")
-    st.markdown(
-        "- **Passo 1**: Envie o CSV.\n"
-        "- **Passo 2**: Gere o **perfil global**.\n"
-        "- **Passo 3**: Faça perguntas (peça gráficos: histograma, heatmap, boxplot, série temporal, scatter…)."
-    )
+    st.markdown(_tips_md())
     st.markdown("---")
     st.caption("Agente EDA • Streamlit Frontend")
 
 # ==============================
 # Session state
 # ==============================
-st.session_state.setdefault("dataset_name", None)          # nome que funcionou por último
-st.session_state.setdefault("dataset_candidates", [])      # candidatos vindos do upload
-st.session_state.setdefault("last_answer", None)
-st.session_state.setdefault("last_details", None)
-st.session_state.setdefault("last_question", None)
+_SESSION_DEFAULTS = (
+    ("dataset_name", None),          # nome que funcionou por último
+    ("dataset_candidates", []),      # candidatos vindos do upload
+    ("dataset_verified", False),     # dataset_candidates[0] já funcionou
+    ("last_answer", None),
+    ("last_details", None),
+    ("last_question", None),
+    ("last_upload", None),           # resposta do último upload
+    ("last_upload_hash", None),      # blake2b do último arquivo enviado
+    ("profile_job", None),           # chamadas em segundo plano
+    ("ask_job", None),
+    ("ask_notice", None),            # aviso de sucesso mostrado após o rerun
+)
+for _k, _v in _SESSION_DEFAULTS:
+    # copia listas para que sessões diferentes não compartilhem o mesmo objeto
+    st.session_state.setdefault(_k, list(_v) if isinstance(_v, list) else _v)
 
 # ==============================
 # 1) Upload (apenas local)
 # ==============================
-st.subheader("1) Upload do CSV (apenas local)")
-
-uploaded = st.file_uploader("Escolha seu arquivo CSV (ex.: creditcard.csv)", type=["csv"])
-if uploaded is not None:
-    size = _human_bytes(len(uploaded.getbuffer()))
-    st.info(f"Arquivo: **{uploaded.name}** • Tamanho: {size}")
-
-    if st.button("⬆️ Enviar para API"):
-        if not backend_ok:
-            st.warning("O backend parece offline. Clique em 'Acordar servidor' e tente de novo.")
-        else:
-            with st.spinner("Enviando arquivo…"):
-                resp = _upload_csv(uploaded)
-
-            if resp.ok:
-                try:
-                    data = resp.json()
-                except Exception:
-                    data = {"_raw_text": resp.text}
-
-                st.success("Upload concluído.")
-                st.code(json.dumps(data, indent=2, ensure_ascii=False), language="json")
-
-                # 🔧 gera candidatos a nome reconhecido pelo backend
-                cands = _candidates_from_upload(data, uploaded.name)
-                if not cands:
-                    st.error("O backend não retornou informações suficientes (filename/relative_path/file_path).")
-                    st.stop()
-
-                st.session_state.dataset_candidates = cands
-                # não assumimos ainda qual funciona; apenas mostramos o primeiro como sugestão
-                st.session_state.dataset_name = cands[0]
-                st.info(f"Possíveis nomes do dataset: {cands}")
-                st.success(f"Dataset sugerido: `{st.session_state.dataset_name}`")
+@st.fragment
+def section_upload():
+    st.subheader("1) Upload do CSV (apenas local)")
+    backend_ok, _ = _health()  # em cache; lido aqui para valer também nos reruns do fragmento
+
+    uploaded = st.file_uploader("Escolha seu arquivo CSV (ex.: creditcard.csv)", type=["csv"])
+    if uploaded is not None:
+        size = _human_bytes(uploaded.size)
+        st.info(f"Arquivo: **{uploaded.name}** • Tamanho: {size}")
+
+        if st.button("⬆️ Enviar para API"):
+            digest = _file_digest(uploaded)
+            if st.session_state.last_upload_hash == digest and st.session_state.dataset_name:
+                st.info("Arquivo já enviado nesta sessão.")
+            elif not backend_ok:
+                st.warning("O backend parece offline. Clique em 'Acordar servidor' e tente de novo.")
             else:
-                st.error(f"Falha no upload: {resp.status_code}")
-                st.code(resp.text, language="text")
+                with st.spinner("Enviando arquivo…"):
+                    resp = _upload_csv(uploaded)
+
+                if resp.is_success:
+                    try:
+                        data = resp.json()
+                    except Exception:
+                        data = {"_raw_text": resp.text}
+
+                    # 🔧 gera candidatos a nome reconhecido pelo backend
+                    cands = _candidates_from_upload(data, uploaded.name)
+                    if not cands:
+                        st.success("Upload concluído.")
+                        st.json(_dumps(data), expanded=False)
+                        st.error("O backend não retornou informações suficientes (filename/relative_path/file_path).")
+                        st.stop()
+
+                    st.session_state.dataset_candidates = cands
+                    # não assumimos ainda qual funciona; apenas mostramos o primeiro como sugestão
+                    st.session_state.dataset_name = cands[0]
+                    st.session_state.dataset_verified = False
+                    st.session_state.last_upload = {"file_id": uploaded.file_id, "data": data, "candidates": cands}
+                    st.session_state.last_upload_hash = digest
+                    # as seções 2 e 3 dependem do dataset: rerun do app inteiro
+                    st.rerun()
+                else:
+                    st.error(f"Falha no upload: {resp.status_code}")
+                    st.code(resp.text, language="text")
+
+        last = st.session_state.last_upload
+        # file_id distingue arquivos diferentes com o mesmo nome
+        if last and last["file_id"] == uploaded.file_id:
+            st.success("Upload concluído.")
+            st.json(_dumps(last["data"]), expanded=False)
+            st.info(f"Possíveis nomes do dataset: {last['candidates']}")
+            st.success(f"Dataset sugerido: `{last['candidates'][0]}`")
 
 # ==============================
 # 2) Perfil Global
 # ==============================
-st.subheader("2) Gerar / Ver Perfil Global")
-st.caption(f"Dataset atual/sugerido: {st.session_state.get('dataset_name') or '—'}")
-
-if not (st.session_state.dataset_name or st.session_state.dataset_candidates):
-    st.info("Envie seu CSV primeiro.")
-else:
-    c1, c2 = st.columns([1, 1])
-
-    with c1:
-        st.markdown("**Gerar / Atualizar perfil (dataset inteiro)**")
-        if st.button("🧮 Gerar perfil global agora"):
-            if not backend_ok:
-                st.warning("O backend parece offline. Clique em 'Acordar servidor' e tente de novo.")
-            else:
-                with st.spinner("Tentando gerar perfil (testando nomes possíveis)…"):
-                    ok, used, out, err = _try_profile(st.session_state.dataset_candidates or [st.session_state.dataset_name])
+@st.fragment
+def section_profile():
+    st.subheader("2) Gerar / Ver Perfil Global")
+    backend_ok, _ = _health()
+    st.caption(f"Dataset atual/sugerido: {st.session_state.get('dataset_name') or '—'}")
+    if st.session_state.dataset_verified:
+        st.button("↺ Testar todos os nomes de novo", on_click=_reset_candidates)
+
+    if not (st.session_state.dataset_name or st.session_state.dataset_candidates):
+        st.info("Envie seu CSV primeiro.")
+    else:
+        c1, c2 = st.columns([1, 1])
+
+        with c1:
+            st.markdown("**Gerar / Atualizar perfil (dataset inteiro)**")
+            if st.button("🧮 Gerar perfil global agora", disabled=bool(st.session_state.profile_job)):
+                if not backend_ok:
+                    st.warning("O backend parece offline. Clique em 'Acordar servidor' e tente de novo.")
+                else:
+                    _start_job(
+                        "profile_job",
+                        functools.partial(_try_profile, known=st.session_state.dataset_verified),
+                        st.session_state.dataset_candidates or [st.session_state.dataset_name],
+                    )
+
+            done = _poll_job("profile_job")
+            if done:
+                _, (ok, used, out, err) = done
                 if ok:
-                    st.session_state.dataset_name = used  # fixa o que funcionou
+                    _remember_dataset(used)  # fixa o que funcionou
                     st.success(f"Perfil (re)gerado com sucesso usando `{used}`.")
-                    st.code(json.dumps(out, indent=2, ensure_ascii=False))
+                    st.json(_dumps(out), expanded=False)
                 else:
                     st.error("Não consegui gerar o perfil com os nomes candidatos.")
                     if err:
                         st.code(str(err), language="text")
                     st.info(f"Candidatos testados: {st.session_state.dataset_candidates}")
 
-    with c2:
-        st.markdown("**Abrir perfil salvo (JSON)**")
-        if st.button("📖 Ver perfil salvo"):
-            if not backend_ok:
-                st.warning("O backend parece offline. Clique em 'Acordar servidor' e tente de novo.")
-            else:
-                with st.spinner("Tentando abrir perfil salvo…"):
-                    ok, used, saved, err = _try_profile_show(st.session_state.dataset_candidates or [st.session_state.dataset_name])
-                if ok:
-                    st.session_state.dataset_name = used
-                    st.success(f"Perfil carregado usando `{used}`.")
-                    st.code(json.dumps(saved, indent=2, ensure_ascii=False))
+        with c2:
+            st.markdown("**Abrir perfil salvo (JSON)**")
+            if st.button("📖 Ver perfil salvo"):
+                if not backend_ok:
+                    st.warning("O backend parece offline. Clique em 'Acordar servidor' e tente de novo.")
                 else:
-                    st.error("Não consegui abrir o perfil salvo com os nomes candidatos.")
-                    if err:
-                        st.code(str(err), language="text")
-                    st.info(f"Candidatos testados: {st.session_state.dataset_candidates}")
+                    with st.spinner("Tentando abrir perfil salvo…"):
+                        ok, used, saved, err = _try_profile_show(
+                            st.session_state.dataset_candidates or [st.session_state.dataset_name],
+                            known=st.session_state.dataset_verified,
+                        )
+                    if ok:
+                        _remember_dataset(used)
+                        st.success(f"Perfil carregado usando `{used}`.")
+                        st.json(_dumps(saved), expanded=False)
+                    else:
+                        st.error("Não consegui abrir o perfil salvo com os nomes candidatos.")
+                        if err:
+                            st.code(str(err), language="text")
+                        st.info(f"Candidatos testados: {st.session_state.dataset_candidates}")
 
 # ==============================
 # 3) Pergunte ao agente
 # ==============================
-st.subheader("3) Pergunte ao agente")
-if not (st.session_state.dataset_name or st.session_state.dataset_candidates):
-    st.info("Envie o CSV e gere o perfil antes de perguntar.")
-else:
-    default_q = "Explique o valor médio de Amount e a taxa de fraude; indique que gráfico eu deveria ver."
-    question = st.text_area("Sua pergunta:", value=default_q, height=120)
-
-    ask_col, tip_col = st.columns([1, 3])
-    with ask_col:
-        if st.button("💬 Perguntar"):
-            if not backend_ok:
-                st.warning("O backend parece offline. Clique em 'Acordar servidor' e tente novamente.")
-            else:
-                with st.spinner("Consultando o agente (testando nomes possíveis)…"):
-                    ok, used, ans, err = _try_agent_ask(st.session_state.dataset_candidates or [st.session_state.dataset_name], question)
+@st.fragment
+def section_ask():
+    st.subheader("3) Pergunte ao agente")
+    backend_ok, _ = _health()
+    if not (st.session_state.dataset_name or st.session_state.dataset_candidates):
+        st.info("Envie o CSV e gere o perfil antes de perguntar.")
+    else:
+        default_q = "Explique o valor médio de Amount e a taxa de fraude; indique que gráfico eu deveria ver."
+        question = st.text_area("Sua pergunta:", value=default_q, height=120)
+
+        ask_col, tip_col = st.columns([1, 3])
+        with ask_col:
+            if st.button("💬 Perguntar", disabled=bool(st.session_state.ask_job)):
+                if not backend_ok:
+                    st.warning("O backend parece offline. Clique em 'Acordar servidor' e tente novamente.")
+                else:
+                    _start_job(
+                        "ask_job",
+                        functools.partial(_ask_and_prefetch, known=st.session_state.dataset_verified),
+                        st.session_state.dataset_candidates or [st.session_state.dataset_name], question,
+                        question=question,
+                    )
+
+            if st.session_state.ask_notice:
+                st.success(st.session_state.ask_notice)
+                st.session_state.ask_notice = None
+
+            done = _poll_job("ask_job")
+            if done:
+                job, (ok, used, ans, err) = done
                 if ok and isinstance(ans, dict):
-                    st.session_state.dataset_name = used
-                    st.session_state.last_question = question
+                    _remember_dataset(used)
+                    st.session_state.last_question = job["question"]
                     st.session_state.last_answer = ans.get("answer")
                     st.session_state.last_details = ans.get("details")
-                    st.success(f"Resposta recebida usando `{used}`.")
+                    st.session_state.ask_notice = f"Resposta recebida usando `{used}`."
+                    # resposta e histórico ficam fora deste fragmento: rerun do app inteiro
+                    st.rerun()
                 else:
                     st.error("Não consegui consultar o agente com os nomes candidatos.")
                     if err:
                         st.code(str(err), language="text")
                     st.info(f"Candidatos testados: {st.session_state.dataset_candidates}")
 
-    with tip_col:
-        st.caption("Peça: 'histograma de Amount (log)', 'heatmap de correlação', 'boxplot Amount por Class', 'série temporal', 'scatter V1 vs V2'…")
+        with tip_col:
+            st.caption("Peça: 'histograma de Amount (log)', 'heatmap de correlação', 'boxplot Amount por Class', 'série temporal', 'scatter V1 vs V2'…")
+
+def _render_answer_and_plots():
+    """
+    Resposta e gráficos fora do fragmento `section_ask`: editar a pergunta
+    reexecuta só aquele fragmento, não este bloco (nem o layout das imagens).
+    """
+    if not (st.session_state.dataset_name or st.session_state.dataset_candidates):
+        return
 
     if st.session_state.last_answer:
         st.markdown("#### Resposta")
         st.write(st.session_state.last_answer)
 
-    if st.session_state.last_details and isinstance(st.session_state.last_details, dict):
-        url_rel = st.session_state.last_details.get("plot_url")
-        url_abs = _abs_url(API_URL, url_rel) if url_rel else None
-        if url_abs:
-            st.image(url_abs, caption="Gráfico gerado pelo agente")
+    details = st.session_state.last_details
+    if not isinstance(details, dict):
+        details = {}
+    url_abs = _abs_url(details.get("plot_url"))
+    direct_path = details.get("plot_path")
+    many = details.get("plot_paths")
+    many = many if isinstance(many, list) else []
+
+    if url_abs:
+        try:
+            st.image(_fetch_image_bytes(url_abs), caption="Gráfico gerado pelo agente")
+        except Exception:
+            st.caption(url_abs)
+    elif direct_path and _LOCAL_FS:
+        try:
+            st.image(direct_path, caption="Gráfico gerado pelo agente")
+        except Exception:
+            pass
+
+    if many:
+        st.markdown("#### Gráficos gerados")
+        absus = [
+            _abs_url(p) if isinstance(p, str) and p.startswith(_REMOTE_PREFIXES) else None
+            for p in many
+        ]
+        fetched = iter(_fetch_images([u for u in absus if u]))
+        blobs = [next(fetched) if absu else None for absu in absus]
+        # colunas só são criadas quando há gráficos para mostrar
+        cols = st.columns(2)
+        if all(b is not None for b in blobs):
+            # tudo baixado: um st.image por coluna com a lista de imagens
+            captions = [os.path.basename(p) for p in many]
+            for c, col in enumerate(cols):
+                if blobs[c::2]:
+                    col.image(blobs[c::2], caption=captions[c::2])
         else:
-            direct_path = st.session_state.last_details.get("plot_path")
-            if direct_path:
-                try:
-                    st.image(direct_path, caption="Gráfico gerado pelo agente")
-                except Exception:
-                    pass
-
-    if st.session_state.last_details and isinstance(st.session_state.last_details, dict):
-        many = st.session_state.last_details.get("plot_paths")
-        if many and isinstance(many, list) and len(many) > 0:
-            st.markdown("#### Gráficos gerados")
-            cols = st.columns(2)
-            for i, p in enumerate(many):
-                absu = _abs_url(API_URL, p) if isinstance(p, str) and p.startswith("/static/") else None
+            for i, (p, absu, blob) in enumerate(zip(many, absus, blobs)):
                 with cols[i % 2]:
-                    if absu:
-                        st.image(absu, caption=os.path.basename(p))
+                    if blob is not None:
+                        st.image(blob, caption=os.path.basename(p))
+                    elif absu or not _LOCAL_FS:
+                        st.caption(p)
                     else:
                         try:
                             st.image(p, caption=os.path.basename(p))
@@ -370,10 +648,26 @@ else:
 # ==============================
 # 4) Histórico
 # ==============================
-st.subheader("4) Histórico desta sessão")
-if st.session_state.get("last_answer"):
-    st.markdown("**Última pergunta e resposta**")
-    st.code(st.session_state.get("last_question", ""), language="markdown")
-    st.write(st.session_state["last_answer"])
-else:
-    st.caption("Na primeira pergunta respondida, o histórico aparece aqui.")
\ No newline at end of file
+def section_history():
+    st.subheader("4) Histórico desta sessão")
+    if st.session_state.get("last_answer"):
+        st.markdown("**Última pergunta e resposta**")
+        st.code(st.session_state.get("last_question", ""), language="markdown")
+        st.write(st.session_state["last_answer"])
+    else:
+        st.caption("Na primeira pergunta respondida, o histórico aparece aqui.")
+
+# ==============================
+# Layout
+# ==============================
+# seções com widgets são fragmentos: cliques e edições reexecutam só a própria seção
+section_upload()
+section_profile()
+# o watcher (run_every=1) só é montado enquanto há job pendente
+if st.session_state.profile_job:
+    _job_watcher("profile_job", "Tentando gerar perfil (testando nomes possíveis)…", timeout=900)
+section_ask()
+if st.session_state.ask_job:
+    _job_watcher("ask_job", "Consultando o agente (testando nomes possíveis)…", timeout=300)
+_render_answer_and_plots()
+section_history()